@@ -20,16 +20,22 @@
 from __future__ import (absolute_import, division, print_function)
 
 import os
+import re
 import json
 import html
-import random
+import time
+import itertools
 from datetime import datetime
 from collections import OrderedDict
 
 from ansible.playbook.role_include import IncludeRole
-from ansible.module_utils._text import to_bytes
 from ansible.plugins.callback import CallbackBase
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
 
 __metaclass__ = type
 
@@ -47,7 +53,7 @@ DOCUMENTATION = """
      - Whitelist in configuration
 """
 
-REPORT_HEAD = b"""\
+REPORT_HEAD_PRE = b"""\
 <!doctype html>
 <html lang="en">
   <head>
@@ -69,7 +75,9 @@ REPORT_HEAD = b"""\
         .btn-sm { padding: 1px 4px; line-height: 1; }
         header .btn-sm { margin: 0 5px; }
     </style>
-    <title>%s</title>
+    <title>"""
+
+REPORT_HEAD_POST = b"""</title>
   </head>
   <body>
     <header class="navbar navbar-expand navbar-dark flex-column flex-md-row bd-navbar">
@@ -105,6 +113,29 @@ COLORS = OrderedDict(
     unreachable='danger'
 )
 
+STATUS_RANK = {name: rank for rank, name in enumerate(COLORS)}
+
+_ALERT_OPEN = {
+    color: '<div class="alert alert-%s collapse show" role="alert">' % color
+    for color in set(COLORS.values())
+}
+_ALERT_BTN = {
+    color: '<a class="btn btn-%s btn-sm" data-toggle="collapse" '
+           'href="#x%%s" role="button" aria-expanded="false" '
+           'aria-controls="x%%s">+</a>' % color
+    for color in set(COLORS.values())
+}
+
+_DIV_ID = itertools.count()
+
+_ANSI_RE = re.compile(r'\x1b?\[(0;31|0;32|0;36|0)m')
+_ANSI_MAP = {
+    '0;31': '<code class="text-danger">',
+    '0;32': '<code class="text-success">',
+    '0;36': '<code class="text-info">',
+    '0': '</code>'
+}
+
 
 def code_block(content):
     """Embed content in an HTML code block
@@ -115,29 +146,44 @@ def code_block(content):
     return "<code><pre>" + content + "</pre></code>"
 
 
-def debug_block(data):
-    """Embed data in an HTML debug block
+def json_dumps(data):
+    """Serialize data to an indented json string
+
+    Serialization goes through orjson when available, falling back to
+    the stdlib json module.
+
+    :param obj data: Data to serialize
+    :return: Serialized data as :func:`str`
+    """
+    if orjson is not None:
+        try:
+            return orjson.dumps(data, option=orjson.OPT_INDENT_2).decode()
+        except TypeError:
+            pass
+    return json.dumps(data, indent=2)
+
+
+def debug_block(serialized):
+    """Embed pre-serialized data in an HTML debug block
 
-    :param obj data: Data to embed
-    :return: Json serialized embedded data as :func:`str`
+    :param str serialized: Json serialized data to embed
+    :return: Embedded data as :func:`str`
     """
     return color_block(
         "skipped",
         "Debug",
-        code_block(html.escape(json.dumps(data, indent=2)))
+        code_block(html.escape(serialized))
     )
 
 
 def color_block(status, header=None, content=None):
     """"""
     color = COLORS[status]
-    div_id = str(random.random())[2:]
-    parts = ['<div class="alert alert-%s collapse show" role="alert">' % color]
+    div_id = format(next(_DIV_ID), 'x')
+    parts = [_ALERT_OPEN[color]]
 
     if header and content:
-        parts.append('<a class="btn btn-%s btn-sm" data-toggle="collapse" '
-                     'href="#x%s" role="button" aria-expanded="false" '
-                     'aria-controls="x%s">+</a>' % (color, div_id, div_id))
+        parts.append(_ALERT_BTN[color] % (div_id, div_id))
 
     if header:
         parts.append("<strong>%s</strong>" % header)
@@ -164,11 +210,7 @@ def cli_colors_to_html(text):
     :param str text: Text to convert
     :return: HTML colored text as :func:`str`
     """
-    return html.escape(text) \
-        .replace('[0;31m', '<code class="text-danger">') \
-        .replace('[0;32m', '<code class="text-success">') \
-        .replace('[0;36m', '<code class="text-info">') \
-        .replace('[0m', '</code>')
+    return _ANSI_RE.sub(lambda m: _ANSI_MAP[m.group(1)], html.escape(text))
 
 
 def color_html(status, text):
@@ -188,20 +230,18 @@ def strip_internal_keys(result):
     :param obj result: Ansible result
     :return: Cleaned Ansible result
     """
-    if isinstance(result, list):
-        for element in result:
-            if isinstance(element, (dict, list)):
-                strip_internal_keys(element)
-    elif isinstance(result, dict):
-        for k in list(result.keys()):
-            if isinstance(k, str):
-                if k.startswith('_ansible_'):
-                    del result[k]
-                    continue
-            if isinstance(result[k], (dict, list)):
-                strip_internal_keys(result[k])
-    else:
-        pass
+    stack = [result]
+    while stack:
+        obj = stack.pop()
+        if isinstance(obj, dict):
+            to_del = [k for k in obj
+                      if isinstance(k, str) and k.startswith('_ansible_')]
+            for k in to_del:
+                del obj[k]
+            stack.extend(v for v in obj.values()
+                         if isinstance(v, (dict, list)))
+        elif isinstance(obj, list):
+            stack.extend(e for e in obj if isinstance(e, (dict, list)))
     return result
 
 
@@ -212,11 +252,11 @@ def highest_status(status, results_list):
     :param list results_list: Ansible results list
     :return: Highest status as :func:`str`
     """
-    s_order = list(COLORS.keys())
-    for r in list(results_list):
-        if not status \
-           or s_order.index(r['status']) > s_order.index(status):
-            status = r['status']
+    best = STATUS_RANK.get(status, -1)
+    for r in results_list:
+        rank = STATUS_RANK[r['status']]
+        if rank > best:
+            best, status = rank, r['status']
     return status
 
 
@@ -229,7 +269,7 @@ class TaskData(object):
     """
     def __init__(self, play, task, prefix="TASK"):
         self._play = play
-        self.start = datetime.now()
+        self.start_ts = time.time()
         self.name = task.get_name()
         self.file = task.get_path()
         self.prefix = prefix
@@ -268,7 +308,7 @@ class TaskData(object):
 
         :return: Task header as :func:`str`
         """
-        now = self.start.strftime(TIME_FORMAT)
+        now = datetime.fromtimestamp(self.start_ts).strftime(TIME_FORMAT)
         header = "%s: %s - %s: %s" % (now, self.status, self.prefix, self.name)
         if self.task_type == "IncludeRole":
             header += " (include role)"
@@ -319,13 +359,16 @@ class TaskData(object):
             self.results[result_id] = {}
 
         self.results[result_id].update({
-            'datetime': datetime.now(),
+            'ts': time.time(),
             'host': result._host.get_name(),
             'status': status,
             'task_name': result._task.get_name(),
             'deleg_vars': result._result.get('_ansible_delegated_vars', None),
             'diffs': self.get_diff(result._result, status),
-            'result': strip_internal_keys(result._result)
+            'result_json': json_dumps({
+                'task_file': self.file,
+                'result': strip_internal_keys(result._result)
+            })
         })
 
     def to_html(self):
@@ -344,7 +387,7 @@ class TaskData(object):
             )
             return color_block(self.status, self.header, html_content)
 
-        html_content = ""
+        html_parts = []
         for result in self.results.values():
 
             header = "%s: %s" % (result['status'], result['host'])
@@ -352,19 +395,21 @@ class TaskData(object):
             if result['deleg_vars']:
                 header += " => %s" % result['deleg_vars']['ansible_host']
 
+            esc_header = html.escape(header)
+
             # reset "ok" status to "include" for successful includes
             if result['status'] == "ok" and self.status == "include":
                 result['status'] = self.status
 
             # If status is skipped or include, do not show details
             if result['status'] in ["skipped", "include"]:
-                html_content += color_block(
+                html_parts.append(color_block(
                     result['status'],
-                    header=html.escape(header)
-                )
+                    header=esc_header
+                ))
 
             else:
-                content = ""
+                content_parts = []
                 for diff in result.get('diffs', []):
                     if diff['item']:
                         item = '<div class="item">Item: %s</div>\n' % (
@@ -373,14 +418,15 @@ class TaskData(object):
                         item = ""
 
                     if diff['failed']:
-                        content += color_block(
+                        content_parts.append(color_block(
                             "failed",
                             content='%s<div class="item">Msg: %s</div>' % (
-                                item, html.escape(str(diff['msg']))))
+                                item, html.escape(str(diff['msg'])))))
 
                     elif not diff['changed']:
                         if item:
-                            content += color_block("ok", content=item)
+                            content_parts.append(color_block("ok",
+                                                             content=item))
 
                     else:
                         if diff['diff']:
@@ -390,18 +436,18 @@ class TaskData(object):
                         else:
                             diff = ""
                         if item or diff:
-                            content += color_block(
+                            content_parts.append(color_block(
                                 result['status'], content='%s%s' % (item, diff)
-                            )
+                            ))
 
-                html_content += color_block(
+                content_parts.append(debug_block(result['result_json']))
+                html_parts.append(color_block(
                     result['status'],
-                    html.escape(header),
-                    content + debug_block({'task_file': self.file,
-                                           'result': result['result']})
-                )
+                    esc_header,
+                    "".join(content_parts)
+                ))
 
-        return color_block(self.status, self.header, html_content)
+        return color_block(self.status, self.header, "".join(html_parts))
 
 
 class CallbackModule(CallbackBase):
@@ -433,21 +479,22 @@ class CallbackModule(CallbackBase):
         if self._stats:
             status = ['ok', 'changed', 'unreachable', 'failures']
             sum_status = dict(zip(status, [0, 0, 0, 0]))
-            text = ""
+            text_parts = []
             for host in sorted(self._stats.processed.keys()):
                 t = self._stats.summarize(host)
                 host_color = [s for s in status if t[s]][-1]
-                text += "%s : " % color_html(host_color, host)
+                text_parts.append("%s : " % color_html(host_color, host))
                 for s in status:
                     sum_status[s] += t[s]
                     entry = "%s=%s  " % (s, t[s])
-                    text += color_html(s, entry) if t[s] else entry
-                text += "\n"
-            sum_line = "Hosts: %d\nSummary: " % len(self._stats.processed)
+                    text_parts.append(color_html(s, entry) if t[s] else entry)
+                text_parts.append("\n")
+            sum_parts = ["Hosts: %d\nSummary: " % len(self._stats.processed)]
             for s, n in sum_status.items():
                 entry = "%s=%s  " % (s, n)
-                sum_line += color_html(s, entry) if n else entry
-            return sum_line + "\n" + text
+                sum_parts.append(color_html(s, entry) if n else entry)
+            sum_parts.append("\n")
+            return "".join(sum_parts) + "".join(text_parts)
         return ""
 
     @summary.setter
@@ -476,15 +523,14 @@ class CallbackModule(CallbackBase):
         self.tasks[-1].record_result(result, status)
 
     def to_html(self):
-        """Get HTML representation of this object
+        """Generate HTML representation of this object
 
-        :return: HTML representation as :func:`str`
+        :return: Generator of HTML chunks as :func:`str`
         """
-        content = ""
         header = "PLAY: " + self.name
         if self.check_mode:
             header += "  [check mode]"
-        content += color_block(
+        yield color_block(
             'play',
             header,
             code_block(
@@ -501,8 +547,7 @@ class CallbackModule(CallbackBase):
             )
         )
         for task in self.tasks:
-            content += task.to_html()
-        return content
+            yield task.to_html()
 
     def write_report(self):
         """Generate, and write HTML report on disk
@@ -516,8 +561,12 @@ class CallbackModule(CallbackBase):
         path = os.path.join(self.reports_path, report_name)
 
         with open(path, "wb") as report_fd:
-            report_fd.write(REPORT_HEAD % report_name.encode())
-            report_fd.write(to_bytes(self.to_html()))
+            report_fd.write(
+                REPORT_HEAD_PRE + report_name.encode() + REPORT_HEAD_POST)
+            report_fd.writelines(
+                chunk.encode('utf-8', errors='replace')
+                for chunk in self.to_html()
+            )
             report_fd.write(REPORT_FOOT)
 
     def v2_playbook_on_play_start(self, play):
@@ -18,13 +18,33 @@
 #  You should have received a copy of the MIT License along with this
 #  program; if not, see <https://opensource.org/licenses/MIT>.
 
+import os
+import sys
+import time
+import hashlib
 import argparse
-import json
 import netmiko
+import yaml
+from concurrent import futures
+
+try:
+    import orjson as json
+except ImportError:
+    import json
+
+try:
+    from yaml import CSafeDumper as SafeDumper
+except ImportError:
+    from yaml import SafeDumper
 
 
 VERSION = "0.3.0"
 
+CACHE_DIR = os.path.expanduser("~/.cache/nxos_reader")
+
+VLAN_ID_KEY = sys.intern('vlanshowbr-vlanid')
+VLAN_NAME_KEY = sys.intern('vlanshowbr-vlanname')
+
 
 class UnsupportedFeature(RuntimeError):
     def __init__(self, feature):
@@ -37,39 +57,54 @@ class UnsupportedFeature(RuntimeError):
         self.__repr__()
 
 
+def as_list(row):
+    """Normalize an NX-OS ROW_* payload to a list of records
+
+    NX-OS json output collapses single-entry tables to a bare dict,
+    which would otherwise be iterated as its keys.
+
+    :param obj row: ROW_* payload from a parsed show command
+    :return: Records as :func:`list` of :obj:`dict`
+    """
+    if isinstance(row, dict):
+        return [row]
+    return row
+
+
 class Entry(dict):
     """"""
 
-    def to_json(self):
-        output = ["name: '{vlan_name}'", "vlan_id: {vlan_id}"]
+    def to_record(self):
+        """Get this entry as a plain record suited for YAML dumping
+
+        Only the fields relevant to the entry variant are included,
+        matching the historical hand-built output.
+
+        :return: Entry fields as :obj:`dict`
+        """
+        record = {'name': self['vlan_name'], 'vlan_id': int(self['vlan_id'])}
 
         if self['vni'] is not None:
-            output.extend([
-                "vrf: '{vrf}'",
-                "isL3: {isl3}",
-                "vni: {vni}"
-            ])
+            record.update(vrf=self['vrf'], isL3=self['isl3'], vni=self['vni'])
             if self['isl3'] is False:
-                output.extend(["gwip: {masterip}", "mask: {mask} "])
+                record.update(gwip=self['masterip'], mask=self['mask'])
         elif self['masterip']:
-            output.extend([
-                "vrf: '{vrf}'",
-                "masterip: {masterip}",
-                "slaveip: {slaveip}",
-                "mask: {mask}"
-            ])
+            record.update(vrf=self['vrf'], masterip=self['masterip'],
+                          slaveip=self['slaveip'], mask=self['mask'])
             if self['vip']:
-                output.extend(["vip: {vip}"])
+                record['vip'] = self['vip']
 
-        return "- { " + ", ".join(output).format(**self) + " }"
+        return record
 
 
 class Nexus(object):
     """"""
 
-    def __init__(self, conn_str):
+    def __init__(self, conn_str, cache_ttl=0):
         """"""
         self.user, self.fqdn = conn_str.split('@', 1)
+        self.cache_ttl = cache_ttl
+        self._cmd_cache = {}
         self.device = {
             'device_type': 'cisco_nxos',
             'host': self.fqdn,
@@ -84,6 +119,10 @@ class Nexus(object):
         self._interfaces = None
         self._hsrp = None
         self._vxlan = None
+        self._iface_by_name = None
+        self._vrf_by_if = None
+        self._hsrp_by_if = None
+        self._macs_by_vlan = None
 
     @property
     def conn(self):
@@ -92,80 +131,168 @@ class Nexus(object):
             self._conn = netmiko.ConnectHandler(**self.device)
         return self._conn
 
+    def _cache_path(self, command):
+        digest = hashlib.sha1(
+            ("%s %s" % (self.fqdn, command)).encode()).hexdigest()
+        return os.path.join(CACHE_DIR, digest)
+
+    def _cached(self, command, conn=None):
+        """Get command output through in-memory and on-disk caches
+
+        The on-disk cache is only used when cache_ttl is positive.
+        Entries are keyed on the switch fqdn and the command, and
+        stored under ~/.cache/nxos_reader.
+
+        :param str command: Command to run
+        :param obj conn: Optional netmiko connection to run it on
+        :return: Command output as :func:`str`
+        """
+        if command in self._cmd_cache:
+            return self._cmd_cache[command]
+
+        path = None
+        if self.cache_ttl > 0:
+            path = self._cache_path(command)
+            try:
+                if os.path.getmtime(path) + self.cache_ttl > time.time():
+                    with open(path) as cache_fd:
+                        out = cache_fd.read()
+                    self._cmd_cache[command] = out
+                    return out
+            except OSError:
+                pass
+
+        if conn is None:
+            conn = self.conn
+        out = conn.send_command(command)
+        self._cmd_cache[command] = out
+        if path is not None:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            with open(path, "w") as cache_fd:
+                cache_fd.write(out)
+        return out
+
     @property
     def mac_addrs(self):
-        if not self._mac_addrs:
-            out = self.conn.send_command("show mac address-table | json")
-            self._mac_addrs = json.loads(out)['TABLE_mac_address']
-        return self._mac_addrs['ROW_mac_address']
+        if self._mac_addrs is None:
+            out = self._cached("show mac address-table | json")
+            self._mac_addrs = as_list(
+                json.loads(out)['TABLE_mac_address']['ROW_mac_address'])
+        return self._mac_addrs
 
     @property
     def vlans(self):
-        if not self._vlans:
-            out = self.conn.send_command("show vlan all | json")
-            self._vlans = json.loads(out)['TABLE_vlanbriefallports']
-        return self._vlans['ROW_vlanbriefallports']
+        if self._vlans is None:
+            out = self._cached("show vlan all | json")
+            self._vlans = as_list(
+                json.loads(out)
+                ['TABLE_vlanbriefallports']['ROW_vlanbriefallports'])
+        return self._vlans
 
     @property
     def interfaces(self):
-        if not self._interfaces:
-            out = self.conn.send_command("show interface | json")
-            self._interfaces = json.loads(out)["TABLE_interface"]
-        return self._interfaces["ROW_interface"]
+        if self._interfaces is None:
+            out = self._cached("show interface | json")
+            self._interfaces = as_list(
+                json.loads(out)["TABLE_interface"]["ROW_interface"])
+        return self._interfaces
 
     def get_interface(self, name):
-        for iface in self.interfaces:
-            if name == iface["interface"]:
-                return iface
-        return {}
+        if self._iface_by_name is None:
+            self._iface_by_name = {
+                i['interface']: i for i in self.interfaces
+            }
+        return self._iface_by_name.get(name, {})
 
     @property
     def vrfs(self):
-        if not self._vrfs:
-            out = self.conn.send_command("show vrf all | json")
-            self._vrfs = json.loads(out)["TABLE_vrf"]
-        return self._vrfs["ROW_vrf"]
+        if self._vrfs is None:
+            out = self._cached("show vrf all | json")
+            self._vrfs = as_list(json.loads(out)["TABLE_vrf"]["ROW_vrf"])
+        return self._vrfs
 
     @property
     def vrf_ifaces(self):
-        if not self._vrf_ifaces:
-            out = self.conn.send_command("show vrf all interface | json")
-            self._vrf_ifaces = json.loads(out)["TABLE_if"]
-        return self._vrf_ifaces["ROW_if"]
+        if self._vrf_ifaces is None:
+            out = self._cached("show vrf all interface | json")
+            self._vrf_ifaces = as_list(json.loads(out)["TABLE_if"]["ROW_if"])
+        return self._vrf_ifaces
 
     def get_vrf(self, iface_name):
-        vrf_name = "default"
-        for vrf in self.vrf_ifaces:
-            if vrf['if_name'] == iface_name:
-                vrf_name = vrf['vrf_name']
-        return vrf_name
+        if self._vrf_by_if is None:
+            self._vrf_by_if = {
+                v['if_name']: v['vrf_name'] for v in self.vrf_ifaces
+            }
+        return self._vrf_by_if.get(iface_name, "default")
 
     def get_vlan_macs(self, vlan_id, skip_local=True):
-        for mac in [m for m in self.mac_addrs if m['disp_vlan'] == vlan_id]:
+        if self._macs_by_vlan is None:
+            self._macs_by_vlan = {}
+            for mac in self.mac_addrs:
+                self._macs_by_vlan.setdefault(mac['disp_vlan'], []).append(mac)
+        for mac in self._macs_by_vlan.get(vlan_id, []):
             if skip_local and mac['disp_type'] in ['G']:
                 continue
             yield mac
 
     @property
     def hsrp(self):
-        if not self._hsrp:
-            out = self.conn.send_command("show hsrp all | json")
+        if self._hsrp is None:
+            out = self._cached("show hsrp all | json")
             if "% Invalid command" in out:
                 raise UnsupportedFeature("hsrp")
-            self._hsrp = json.loads(out)["TABLE_grp_detail"]
-        return self._hsrp['ROW_grp_detail']
+            self._hsrp = as_list(
+                json.loads(out)["TABLE_grp_detail"]['ROW_grp_detail'])
+        return self._hsrp
 
     def get_hsrp(self, iface_name):
-        for hsrp in self.hsrp:
-            if hsrp['sh_if_index'] == iface_name:
-                return hsrp
-        return {}
+        if self._hsrp_by_if is None:
+            self._hsrp_by_if = {
+                h['sh_if_index']: h for h in self.hsrp
+            }
+        return self._hsrp_by_if.get(iface_name, {})
+
+    def prefetch(self, vxlan=False, interfaces_only=False, skip=()):
+        """Collect show command outputs needed by :func:`gather_data`
+
+        Netmiko connections only support one command at a time, so
+        each command is run over its own dedicated session from a
+        thread pool. Total latency is roughly the slowest command
+        instead of the sum of them all.
+
+        :param bool vxlan: Collect vxlan data instead of hsrp
+        :param bool interfaces_only: Only collect interfaces data
+        :param obj skip: Features to skip (ie. hsrp, vrf)
+        """
+        commands = ["show interface | json"]
+        if not interfaces_only:
+            commands.append("show vlan all | json")
+            if 'vrf' not in skip:
+                commands.append("show vrf all interface | json")
+            if vxlan:
+                commands.append("show vxlan")
+            elif 'hsrp' not in skip:
+                commands.append("show hsrp all | json")
+
+        def fetch(command):
+            conn = netmiko.ConnectHandler(**self.device)
+            try:
+                self._cached(command, conn=conn)
+            finally:
+                conn.disconnect()
+
+        with futures.ThreadPoolExecutor(len(commands)) as executor:
+            jobs = [executor.submit(fetch, command)
+                    for command in commands
+                    if command not in self._cmd_cache]
+            for job in jobs:
+                job.result()
 
     @property
     def vxlan(self):
-        if not self._vxlan:
+        if self._vxlan is None:
             self._vxlan = {}
-            out = self.conn.send_command("show vxlan")
+            out = self._cached("show vxlan")
             for line in out.splitlines():
                 if line.startswith('Vlan') or line.startswith('===='):
                     continue
@@ -174,18 +301,33 @@ class Nexus(object):
         return self._vxlan
 
 
-def gather_data(conn_str_a, conn_str_b, vxlan=False):
-    m_sw = Nexus(conn_str_a)
+def gather_data(conn_str_a, conn_str_b, vxlan=False, cache_ttl=0, skip=()):
+    m_sw = Nexus(conn_str_a, cache_ttl=cache_ttl)
     if conn_str_b:
-        s_sw = Nexus(conn_str_b)
+        s_sw = Nexus(conn_str_b, cache_ttl=cache_ttl)
+
+    skip_hsrp = 'hsrp' in skip
+    skip_vrf = 'vrf' in skip
+
+    with futures.ThreadPoolExecutor(max_workers=2) as executor:
+        jobs = [executor.submit(m_sw.prefetch, vxlan, skip=skip)]
+        if conn_str_b and not vxlan:
+            jobs.append(executor.submit(s_sw.prefetch, interfaces_only=True))
+        for job in jobs:
+            job.result()
+
+    vxlan_vnis = m_sw.vxlan if vxlan else None
+    get_interface = m_sw.get_interface
+    get_vrf = m_sw.get_vrf
+    get_hsrp = m_sw.get_hsrp
 
     entries = []
     for vlan in m_sw.vlans:
-        vlan_id = vlan['vlanshowbr-vlanid']
-        iface_name = "Vlan" + vlan_id
-        iface = m_sw.get_interface(iface_name)
+        vlan_id = vlan[VLAN_ID_KEY]
+        iface_name = f"Vlan{vlan_id}"
+        iface = get_interface(iface_name)
 
-        vrf_name = m_sw.get_vrf(iface_name)
+        vrf_name = "default" if skip_vrf else get_vrf(iface_name)
         mask = iface.get("svi_ip_mask")
 
         slaveip = None
@@ -194,10 +336,12 @@ def gather_data(conn_str_a, conn_str_b, vxlan=False):
         vni = None
 
         if not vxlan:
-            hsrp = m_sw.get_hsrp(iface_name)
-            masterip = hsrp.get('sh_active_router_addr')
-            slaveip = hsrp.get('sh_standby_router_addr')
-            vip = hsrp.get('sh_vip')
+            hsrp = None if skip_hsrp else get_hsrp(iface_name)
+            masterip = None
+            if hsrp:
+                masterip = hsrp.get('sh_active_router_addr')
+                slaveip = hsrp.get('sh_standby_router_addr')
+                vip = hsrp.get('sh_vip')
 
             if not masterip:
                 masterip = iface.get('svi_ip_addr')
@@ -205,13 +349,13 @@ def gather_data(conn_str_a, conn_str_b, vxlan=False):
                 if s_iface:
                     slaveip = s_iface.get('svi_ip_addr')
         else:
-            vni = m_sw.vxlan.get(vlan_id)
+            vni = vxlan_vnis.get(vlan_id)
             masterip = iface.get('svi_ip_addr')
             isl3 = False if masterip else True
 
         entries.append(Entry(
             vlan_id=vlan_id,
-            vlan_name=vlan['vlanshowbr-vlanname'],
+            vlan_name=vlan[VLAN_NAME_KEY],
             vrf=vrf_name,
             vni=vni,
             masterip=masterip,
@@ -223,14 +367,15 @@ def gather_data(conn_str_a, conn_str_b, vxlan=False):
     return entries
 
 
-def show_vlans_macs(conn_str):
-    m_sw = Nexus(conn_str)
+def show_vlans_macs(conn_str, cache_ttl=0):
+    m_sw = Nexus(conn_str, cache_ttl=cache_ttl)
+    lines = []
     for vlan in m_sw.vlans:
-        vlan_id = vlan['vlanshowbr-vlanid']
-        print("vlan %s mac addresses count: %d" % (
-            vlan_id,
-            len(list(m_sw.get_vlan_macs(vlan_id)))
-        ))
+        vlan_id = vlan[VLAN_ID_KEY]
+        macs_count = len(list(m_sw.get_vlan_macs(vlan_id)))
+        lines.append(f"vlan {vlan_id} mac addresses count: {macs_count}")
+    if lines:
+        sys.stdout.write("\n".join(lines) + "\n")
 
 
 if __name__ == "__main__":
@@ -253,8 +398,17 @@ if __name__ == "__main__":
     parser.add_argument('-e', '--vlans-macs', dest="vlans_macs",
                         action="store_true",
                         help='show discovered macs per vlan')
+    parser.add_argument('--cache-ttl', dest="cache_ttl", type=int, default=0,
+                        metavar="SECONDS",
+                        help='cache command outputs on disk for the given'
+                             ' time, 0 disables caching (default: 0)')
+    parser.add_argument('--skip', dest="skip", default='',
+                        metavar="FEATURES",
+                        help='comma separated features to skip,'
+                             ' among "hsrp" and "vrf"')
 
     args = parser.parse_args()
+    skipped = frozenset(f for f in args.skip.split(',') if f)
 
     if args.version:
         print("Script version: %s" % VERSION)
@@ -262,7 +416,8 @@ if __name__ == "__main__":
 
     targets = None
     if args.targets_file:
-        targets = open(args.targets_file).readlines()
+        with open(args.targets_file) as targets_fd:
+            targets = [line.strip() for line in targets_fd if line.strip()]
     elif not args.m_conn:
         parser.error('master connection string not provided')
         exit(1)
@@ -277,32 +432,38 @@ if __name__ == "__main__":
     if targets is not None:
         entries = {}
         for line in targets:
-            target = line.strip().split('|', 1)
+            target = line.split('|', 1)
             master = target[0]
             slave = target[1] if len(target) == 2 else None
 
             try:
                 if args.vlans_macs:
-                    show_vlans_macs(master)
+                    show_vlans_macs(master, args.cache_ttl)
                     continue
 
-                data = gather_data(master, slave, args.vxlan)
+                data = gather_data(master, slave, args.vxlan, args.cache_ttl,
+                                   skipped)
             except:
-                print("# unresponsive targets: " + line.strip())
+                print("# unresponsive targets: " + line)
                 continue
 
             for entry in data:
                 if entry['vlan_id'] not in entries:
                     entries[entry['vlan_id']] = entry
 
-        for entry in entries.values():
-            print(entry.to_json())
+        if entries:
+            yaml.dump([e.to_record() for e in entries.values()], sys.stdout,
+                      Dumper=SafeDumper, default_flow_style=None,
+                      sort_keys=False)
 
     else:
         if args.vlans_macs:
-            show_vlans_macs(args.m_conn)
+            show_vlans_macs(args.m_conn, args.cache_ttl)
             exit(1)
 
-        data = gather_data(args.m_conn, args.s_conn, args.vxlan)
-        for entry in data:
-            print(entry.to_json())
+        data = gather_data(args.m_conn, args.s_conn, args.vxlan,
+                           args.cache_ttl, skipped)
+        if data:
+            yaml.dump([e.to_record() for e in data], sys.stdout,
+                      Dumper=SafeDumper, default_flow_style=None,
+                      sort_keys=False)